@@ -0,0 +1,110 @@
+"""Admission control for /api/upload.
+
+Decides, before the request body is read, whether an upload is accepted
+(possibly queued behind running jobs, with an ETA) or turned away with
+429 (queue full) / 503 (host short on memory or disk) and a Retry-After.
+Thresholds come from ADMISSION_* environment variables; a limit of 0
+disables that check.
+
+Memory and disk are measured by the workers (``free_memory_bytes`` /
+``free_disk_bytes`` on their scratch directory) and published as heartbeats,
+since the API host is not necessarily where jobs run.
+"""
+import math
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+MB = 1024 * 1024
+
+
+@dataclass
+class AdmissionLimits:
+    max_in_flight: int = 1          # jobs processed at once across all workers, until heartbeats report it
+    max_queue_depth: int = 20       # pending jobs allowed to wait for a worker
+    min_free_memory_mb: int = 1024  # Demucs needs a few GB per job
+    min_free_disk_mb: int = 2048    # stems are ~10x the size of the upload
+    avg_job_seconds: float = 180.0  # used for ETAs and Retry-After
+
+    @classmethod
+    def from_env(cls) -> "AdmissionLimits":
+        return cls(
+            max_in_flight=int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', os.environ.get('WORKER_CONCURRENCY', '1'))),
+            max_queue_depth=int(os.environ.get('ADMISSION_MAX_QUEUE_DEPTH', '20')),
+            min_free_memory_mb=int(os.environ.get('ADMISSION_MIN_FREE_MEMORY_MB', '1024')),
+            min_free_disk_mb=int(os.environ.get('ADMISSION_MIN_FREE_DISK_MB', '2048')),
+            avg_job_seconds=float(os.environ.get('ADMISSION_AVG_JOB_SECONDS', '180')),
+        )
+
+
+@dataclass
+class AdmissionDecision:
+    accepted: bool
+    status_code: int
+    message: str
+    retry_after: Optional[int] = None
+    queue_position: int = 0
+    eta_seconds: Optional[int] = None
+
+
+def free_memory_bytes() -> Optional[int]:
+    """Memory available for new work (MemAvailable), or None if unknown"""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def free_disk_bytes(path: Path) -> Optional[int]:
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+def decide(limits: AdmissionLimits, queue_depth: int, in_flight: int,
+           free_memory: Optional[int], free_disk: Optional[int],
+           upload_size: Optional[int] = None) -> AdmissionDecision:
+    """Admit or reject one upload given the current load"""
+    slots = max(limits.max_in_flight, 1)
+    # Time until a worker slot frees up, assuming average-length jobs
+    slot_wait = max(1, math.ceil(limits.avg_job_seconds / slots))
+
+    if limits.min_free_disk_mb and free_disk is not None:
+        if free_disk - (upload_size or 0) < limits.min_free_disk_mb * MB:
+            return AdmissionDecision(False, 503, "Server is low on disk space, try again later",
+                                     retry_after=slot_wait)
+
+    if limits.max_queue_depth and queue_depth >= limits.max_queue_depth:
+        overflow = queue_depth - limits.max_queue_depth + 1
+        return AdmissionDecision(False, 429, "Too many jobs queued, try again later",
+                                 retry_after=overflow * slot_wait)
+
+    free_slots = max(slots - in_flight, 0)
+    starts_now = queue_depth < free_slots
+
+    # Memory only matters for a job that would start right away: running jobs
+    # normally hold most of it, and a queued job waits for a worker slot
+    # (which frees that memory) anyway
+    if starts_now and limits.min_free_memory_mb and free_memory is not None:
+        if free_memory < limits.min_free_memory_mb * MB:
+            return AdmissionDecision(False, 503, "Server is low on memory, try again later",
+                                     retry_after=slot_wait)
+
+    if starts_now:
+        wait = 0
+    else:
+        wait = math.ceil((queue_depth - free_slots + 1) / slots) * math.ceil(limits.avg_job_seconds)
+    eta = wait + math.ceil(limits.avg_job_seconds)
+
+    if wait:
+        message = f"File uploaded successfully. Queued at position {queue_depth + 1}."
+    else:
+        message = "File uploaded successfully. Processing started."
+    return AdmissionDecision(True, 200, message, queue_position=queue_depth + 1 if wait else 0, eta_seconds=eta)
@@ -0,0 +1,274 @@
+"""MIDI to MusicXML conversion stage.
+
+music21 is slow to import and configure, so it is imported lazily and warmed
+once per process with ``warm_music21``. Simple monophonic stems (bass, vocals)
+are written straight from the MIDI events without building a music21 Stream;
+anything else, or anything the direct writer cannot represent, falls back to
+music21.
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+# Stems that are usually a single melodic line and can skip music21
+MONOPHONIC_STEMS = {"bass", "vocals"}
+
+# Grid used by the direct writer: durations are counted in 16th notes
+DIVISIONS = 4
+
+# Overlap (in 16ths) tolerated between consecutive notes before a part is
+# treated as polyphonic. basic-pitch often leaves short release overlaps.
+OVERLAP_TOLERANCE = 1
+
+# Representable durations in 16ths, largest first, with their MusicXML type
+NOTE_VALUES = [
+    (16, "whole", False),
+    (12, "half", True),
+    (8, "half", False),
+    (6, "quarter", True),
+    (4, "quarter", False),
+    (3, "eighth", True),
+    (2, "eighth", False),
+    (1, "16th", False),
+]
+
+PITCH_NAMES = [
+    ("C", 0), ("C", 1), ("D", 0), ("D", 1), ("E", 0), ("F", 0),
+    ("F", 1), ("G", 0), ("G", 1), ("A", 0), ("A", 1), ("B", 0),
+]
+
+_warm_lock = threading.Lock()
+_warmed = False
+
+
+def warm_music21():
+    """Import music21 and exercise its parse/export paths once.
+
+    The first ``converter.parse`` in a process pays for the module import,
+    environment setup and the subconverter registry; doing it up front keeps
+    that cost out of the first job. Safe to call repeatedly.
+    """
+    global _warmed
+    with _warm_lock:
+        if _warmed:
+            return
+        try:
+            from music21 import converter
+            from music21.musicxml.m21ToXml import GeneralObjectExporter
+
+            score = converter.parse("tinyNotation: 4/4 c4 d4 e4 f4")
+            GeneralObjectExporter(score).parse()
+            _warmed = True
+            logger.info("music21 warmed")
+        except Exception as e:
+            logger.warning(f"music21 warm-up failed: {e}")
+
+
+def parse_score(midi_path: Path):
+    """Parse a MIDI file with music21.
+
+    Deliberately uncached: every job writes its MIDI to a fresh path, so a
+    cross-call cache would never hit and would only pin full Stream trees in
+    memory. The reusable cost (import and setup) is paid by ``warm_music21``.
+    """
+    from music21 import converter
+    return converter.parse(str(midi_path))
+
+
+def read_monophonic_notes(midi_path: Path) -> Optional[Tuple[List[Tuple[int, int, int]], int, Tuple[int, int], float]]:
+    """Read notes from a MIDI file if they form a single line.
+
+    Returns ``(notes, measure_length, time_signature, tempo_bpm)`` where notes
+    are ``(start, duration, midi_pitch)`` on the 16th-note grid, or None when
+    the part is polyphonic.
+    """
+    import mido
+
+    midi = mido.MidiFile(str(midi_path))
+    ticks_per_16th = midi.ticks_per_beat / DIVISIONS
+
+    tempo_bpm = None
+    time_signature = None
+    raw_notes = []
+    for track in midi.tracks:
+        tick = 0
+        active = {}
+        for msg in track:
+            tick += msg.time
+            if msg.type == "set_tempo" and tempo_bpm is None:
+                tempo_bpm = mido.tempo2bpm(msg.tempo)
+            elif msg.type == "time_signature" and time_signature is None:
+                time_signature = (msg.numerator, msg.denominator)
+            elif msg.type == "note_on" and msg.velocity > 0:
+                active.setdefault((msg.channel, msg.note), []).append(tick)
+            elif msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0):
+                starts = active.get((msg.channel, msg.note))
+                if starts:
+                    raw_notes.append((starts.pop(0), tick, msg.note))
+
+    time_signature = time_signature or (4, 4)
+    measure_length = time_signature[0] * 16 // time_signature[1]
+    if measure_length <= 0 or measure_length * time_signature[1] != time_signature[0] * 16:
+        return None
+
+    notes = []
+    for start_tick, end_tick, pitch in sorted(raw_notes):
+        start = int(round(start_tick / ticks_per_16th))
+        end = max(int(round(end_tick / ticks_per_16th)), start + 1)
+        if notes:
+            prev_start, prev_duration, prev_pitch = notes[-1]
+            prev_end = prev_start + prev_duration
+            if start < prev_end:
+                if prev_end - start > OVERLAP_TOLERANCE or start <= prev_start:
+                    return None
+                notes[-1] = (prev_start, start - prev_start, prev_pitch)
+        notes.append((start, end - start, pitch))
+
+    return notes, measure_length, time_signature, tempo_bpm or 120.0
+
+
+def _split_duration(duration: int):
+    """Break a duration in 16ths into notatable values"""
+    parts = []
+    for value, note_type, dotted in NOTE_VALUES:
+        while duration >= value:
+            parts.append((value, note_type, dotted))
+            duration -= value
+    return parts
+
+
+def _note_xml(duration: int, pitch: Optional[int], tie_start: bool, tie_stop: bool) -> List[str]:
+    lines = []
+    parts = _split_duration(duration)
+    for i, (value, note_type, dotted) in enumerate(parts):
+        starts = tie_start or i < len(parts) - 1
+        stops = tie_stop or i > 0
+        lines.append("      <note>")
+        if pitch is None:
+            lines.append("        <rest/>")
+        else:
+            step, alter = PITCH_NAMES[pitch % 12]
+            lines.append("        <pitch>")
+            lines.append(f"          <step>{step}</step>")
+            if alter:
+                lines.append(f"          <alter>{alter}</alter>")
+            lines.append(f"          <octave>{pitch // 12 - 1}</octave>")
+            lines.append("        </pitch>")
+        lines.append(f"        <duration>{value}</duration>")
+        if pitch is not None:
+            if stops:
+                lines.append('        <tie type="stop"/>')
+            if starts:
+                lines.append('        <tie type="start"/>')
+        lines.append(f"        <type>{note_type}</type>")
+        if dotted:
+            lines.append("        <dot/>")
+        if pitch is not None and (starts or stops):
+            lines.append("        <notations>")
+            if stops:
+                lines.append('          <tied type="stop"/>')
+            if starts:
+                lines.append('          <tied type="start"/>')
+            lines.append("        </notations>")
+        lines.append("      </note>")
+    return lines
+
+
+def write_simple_musicxml(midi_path: Path, musicxml_path: Path, part_name: str) -> bool:
+    """Write MusicXML for a monophonic MIDI file without music21.
+
+    Returns False (and writes nothing) when the part is not monophonic.
+    """
+    parsed = read_monophonic_notes(midi_path)
+    if parsed is None:
+        return False
+    notes, measure_length, (beats, beat_type), tempo_bpm = parsed
+
+    # Fill the gaps with rests so every 16th of the part is accounted for
+    events = []
+    cursor = 0
+    for start, duration, pitch in notes:
+        if start > cursor:
+            events.append((cursor, start - cursor, None))
+        events.append((start, duration, pitch))
+        cursor = start + duration
+    total = max(cursor, measure_length)
+    if total % measure_length:
+        events.append((cursor, measure_length - total % measure_length, None))
+        total += measure_length - total % measure_length
+    elif cursor < total:
+        events.append((cursor, total - cursor, None))
+
+    pitches = sorted(pitch for _, _, pitch in notes)
+    bass_clef = bool(pitches) and pitches[len(pitches) // 2] < 60
+
+    measures = [[] for _ in range(total // measure_length)]
+    for start, duration, pitch in events:
+        first = True
+        while duration > 0:
+            index = start // measure_length
+            room = (index + 1) * measure_length - start
+            chunk = min(duration, room)
+            remaining = duration - chunk
+            measures[index].extend(_note_xml(chunk, pitch, tie_start=remaining > 0, tie_stop=not first))
+            start += chunk
+            duration = remaining
+            first = False
+
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+        '"http://www.musicxml.org/dtds/partwise.dtd">',
+        '<score-partwise version="4.0">',
+        "  <part-list>",
+        '    <score-part id="P1">',
+        f"      <part-name>{escape(part_name)}</part-name>",
+        "    </score-part>",
+        "  </part-list>",
+        '  <part id="P1">',
+    ]
+    for number, body in enumerate(measures, start=1):
+        lines.append(f'    <measure number="{number}">')
+        if number == 1:
+            lines.extend([
+                "      <attributes>",
+                f"        <divisions>{DIVISIONS}</divisions>",
+                "        <key><fifths>0</fifths></key>",
+                f"        <time><beats>{beats}</beats><beat-type>{beat_type}</beat-type></time>",
+                "        <clef><sign>F</sign><line>4</line></clef>" if bass_clef
+                else "        <clef><sign>G</sign><line>2</line></clef>",
+                "      </attributes>",
+                '      <direction placement="above">',
+                "        <direction-type><metronome><beat-unit>quarter</beat-unit>"
+                f"<per-minute>{round(tempo_bpm)}</per-minute></metronome></direction-type>",
+                f'        <sound tempo="{round(tempo_bpm, 2)}"/>',
+                "      </direction>",
+            ])
+        lines.extend(body)
+        lines.append("    </measure>")
+    lines.extend(["  </part>", "</score-partwise>", ""])
+
+    Path(musicxml_path).write_text("\n".join(lines), encoding="utf-8")
+    return True
+
+
+def convert_midi_to_musicxml(midi_path: Path, musicxml_path: Path, stem_name: str) -> str:
+    """Convert a stem's MIDI file to MusicXML.
+
+    Uses the direct writer for monophonic stems and music21 otherwise.
+    Returns the name of the path taken ("direct" or "music21").
+    """
+    if stem_name in MONOPHONIC_STEMS:
+        try:
+            if write_simple_musicxml(midi_path, musicxml_path, stem_name.title()):
+                return "direct"
+        except Exception as e:
+            logger.warning(f"Direct MusicXML writer failed for {stem_name}, falling back to music21: {e}")
+
+    score = parse_score(midi_path)
+    score.write('musicxml', fp=str(musicxml_path))
+    return "music21"
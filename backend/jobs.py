@@ -0,0 +1,293 @@
+"""Job store shared by the API and the processing workers.
+
+Only depends on Motor and pydantic so the API can import it without pulling in
+any of the audio/ML stack.
+"""
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+import os
+from pathlib import Path
+from pydantic import BaseModel, Field, ConfigDict
+from typing import Dict, List, Optional, Tuple
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from storage import create_storage
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+# Create directories for file storage
+UPLOADS_DIR = Path(os.environ.get('UPLOADS_DIR', ROOT_DIR / '../uploads'))
+PROCESSED_DIR = Path(os.environ.get('PROCESSED_DIR', ROOT_DIR / '../processed'))
+UPLOADS_DIR.mkdir(exist_ok=True)
+PROCESSED_DIR.mkdir(exist_ok=True)
+
+# Uploads still streaming in hold a placeholder job that counts against the
+# queue; one left behind by a crashed API process stops counting after this
+# and is deleted by the workers' reaper
+UPLOAD_RESERVATION_SECONDS = int(os.environ.get('UPLOAD_RESERVATION_SECONDS', '3600'))
+
+# Workers report their free memory and disk this often; a report older than
+# three intervals is treated as a dead worker
+WORKER_HEARTBEAT_SECONDS = float(os.environ.get('WORKER_HEARTBEAT_SECONDS', '10'))
+
+# Artifact store for uploads and outputs; PROCESSED_DIR doubles as the
+# workers' scratch space when the backend is remote
+storage = create_storage(UPLOADS_DIR, PROCESSED_DIR)
+
+# Define Models
+class ProcessingJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    status: str  # uploading, pending, processing, completed, failed, cancelled
+    progress: int = 0
+    message: str = ""
+    upload_file: Optional[str] = None
+    cancel_requested: bool = False
+    deadline_at: Optional[str] = None
+    preview_stems: List[str] = []
+    preview_levels: Dict[str, List[List[int]]] = {}  # stem -> [[samples_per_peak, peak_count], ...]
+    output_file: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class JobStatus(BaseModel):
+    id: str
+    filename: str
+    status: str
+    progress: int
+    message: str
+    output_file: Optional[str] = None
+    preview_stems: List[str] = []
+
+
+def job_document(job: ProcessingJob) -> dict:
+    """Job as stored in MongoDB (timestamps as ISO strings)"""
+    job_dict = job.model_dump()
+    job_dict['created_at'] = job_dict['created_at'].isoformat()
+    job_dict['updated_at'] = job_dict['updated_at'].isoformat()
+    return job_dict
+
+
+async def reserve_upload() -> dict:
+    """Insert an ``uploading`` placeholder job before the upload body is read"""
+    job_dict = job_document(ProcessingJob(
+        filename="",
+        status="uploading",
+        message="Receiving upload..."
+    ))
+    await db.jobs.insert_one(job_dict)
+    job_dict.pop("_id", None)
+    return job_dict
+
+
+async def queue_ahead_of(job: dict) -> int:
+    """Pending jobs and live upload reservations queued before this job.
+
+    Ordering by (created_at, id) gives every reservation a distinct place in
+    line, so concurrent uploads can't all see the same queue depth.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_RESERVATION_SECONDS)).isoformat()
+    return await db.jobs.count_documents({"$and": [
+        {"$or": [
+            {"status": "pending"},
+            {"status": "uploading", "created_at": {"$gte": cutoff}}
+        ]},
+        {"$or": [
+            {"created_at": {"$lt": job["created_at"]}},
+            {"created_at": job["created_at"], "id": {"$lt": job["id"]}}
+        ]}
+    ]})
+
+
+async def finish_upload(job_id: str, filename: str, upload_file: str) -> bool:
+    """Turn an upload reservation into a pending job workers can claim"""
+    result = await db.jobs.update_one(
+        {"id": job_id, "status": "uploading"},
+        {"$set": {
+            "status": "pending",
+            "filename": filename,
+            "upload_file": upload_file,
+            "message": "File uploaded, waiting to process...",
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+    return result.modified_count == 1
+
+
+async def release_upload(job_id: str):
+    """Drop an upload reservation that never became a job"""
+    await db.jobs.delete_one({"id": job_id, "status": "uploading"})
+
+
+async def expire_upload_reservations() -> List[dict]:
+    """Delete upload reservations older than UPLOAD_RESERVATION_SECONDS.
+
+    Returns the deleted reservations so the caller can remove whatever part
+    of their upload reached storage.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_RESERVATION_SECONDS)).isoformat()
+    query = {"status": "uploading", "created_at": {"$lt": cutoff}}
+    expired = []
+    async for job in db.jobs.find(query, {"_id": 0}):
+        result = await db.jobs.delete_one({**query, "id": job["id"]})
+        if result.deleted_count:
+            expired.append(job)
+    return expired
+
+
+async def update_job(job_id: str, **fields):
+    """Set fields on a job document and bump its updated_at"""
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    await db.jobs.update_one({"id": job_id}, {"$set": fields})
+
+
+async def claim_next_job(deadline_seconds: float) -> Optional[dict]:
+    """Atomically move the oldest pending job to processing and return it.
+
+    The job gets a provisional ``deadline_at`` straight away (the worker
+    tightens it once it knows the audio duration), so a job whose worker dies
+    at any point can still be reaped.
+    """
+    now = datetime.now(timezone.utc)
+    return await db.jobs.find_one_and_update(
+        {"status": "pending"},
+        {"$set": {
+            "status": "processing",
+            "message": "Starting processing...",
+            "deadline_at": (now + timedelta(seconds=deadline_seconds)).isoformat(),
+            "updated_at": now.isoformat()
+        }},
+        sort=[("created_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def request_cancel(job_id: str) -> Optional[dict]:
+    """Cancel a job, returning its document afterwards (None if unknown).
+
+    Pending jobs are cancelled outright so no worker claims them; jobs being
+    processed are flagged and the owning worker stops them.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    job = await db.jobs.find_one_and_update(
+        {"id": job_id, "status": "pending"},
+        {"$set": {"status": "cancelled", "message": "Job cancelled.", "updated_at": now}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if job:
+        return job
+    job = await db.jobs.find_one_and_update(
+        {"id": job_id, "status": "processing"},
+        {"$set": {"cancel_requested": True, "message": "Cancelling...", "updated_at": now}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if job:
+        return job
+    return await db.jobs.find_one({"id": job_id}, {"_id": 0})
+
+
+async def release_job(job_id: str) -> Optional[dict]:
+    """Hand back a job its worker is stopping without finishing it.
+
+    A job with a cancel request is cancelled; anything else goes back to
+    pending for another worker. Returns the job afterwards, or None if it was
+    no longer processing (e.g. it completed meanwhile).
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    job = await db.jobs.find_one_and_update(
+        {"id": job_id, "status": "processing", "cancel_requested": True},
+        {"$set": {"status": "cancelled", "message": "Job cancelled.", "updated_at": now}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if job:
+        return job
+    return await db.jobs.find_one_and_update(
+        {"id": job_id, "status": "processing"},
+        {"$set": {
+            "status": "pending",
+            "progress": 0,
+            "message": "File uploaded, waiting to process...",
+            "deadline_at": None,
+            "updated_at": now
+        }},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def reap_abandoned_jobs(grace_seconds: float) -> List[dict]:
+    """Finish off processing jobs whose worker is gone, returning them.
+
+    A live worker stops its own jobs at their deadline, and within a few
+    seconds of a cancel request. A job still processing ``grace_seconds``
+    after either has lost its worker (crash, OOM kill, lost node) and would
+    otherwise stay processing forever.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)).isoformat()
+    rules = [
+        ({"status": "processing", "cancel_requested": True, "updated_at": {"$lt": cutoff}},
+         {"status": "cancelled", "message": "Job cancelled."}),
+        ({"status": "processing", "deadline_at": {"$lt": cutoff}},
+         {"status": "failed", "message": "Processing failed: the worker running this job stopped responding"}),
+    ]
+    reaped = []
+    for query, fields in rules:
+        async for candidate in db.jobs.find(query, {"_id": 0, "id": 1}):
+            # Re-check the condition so two reapers can't finish the same job
+            job = await db.jobs.find_one_and_update(
+                {**query, "id": candidate["id"]},
+                {"$set": {**fields, "updated_at": datetime.now(timezone.utc).isoformat()}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if job:
+                reaped.append(job)
+    return reaped
+
+
+async def publish_heartbeat(worker_id: str, concurrency: int, free_memory: Optional[int], free_disk: Optional[int]):
+    """Record a worker's job slots and current headroom for admission control"""
+    await db.workers.update_one(
+        {"id": worker_id},
+        {"$set": {
+            "id": worker_id,
+            "concurrency": concurrency,
+            "free_memory": free_memory,
+            "free_disk": free_disk,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        upsert=True
+    )
+
+
+async def worker_capacity() -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """Job slots across all live workers, and the most free memory and free
+    disk reported by any one of them.
+
+    A job runs on whichever worker claims it, so one worker with headroom is
+    enough. Returns None for a value no live worker reported.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=3 * WORKER_HEARTBEAT_SECONDS)).isoformat()
+    slots = free_memory = free_disk = None
+    async for worker in db.workers.find({"updated_at": {"$gte": cutoff}}, {"_id": 0}):
+        if worker.get("concurrency"):
+            slots = (slots or 0) + worker["concurrency"]
+        if worker.get("free_memory") is not None:
+            free_memory = max(free_memory or 0, worker["free_memory"])
+        if worker.get("free_disk") is not None:
+            free_disk = max(free_disk or 0, worker["free_disk"])
+    return slots, free_memory, free_disk
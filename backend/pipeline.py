@@ -0,0 +1,259 @@
+"""Processing engine: stem separation, MIDI transcription and MusicXML export.
+
+Only imported by workers. Demucs and basic-pitch run as subprocesses and
+music21 is loaded lazily by ``conversion``, so importing this module stays
+cheap; the heavy work happens when a job actually runs.
+"""
+import os
+import sys
+import signal
+import logging
+from pathlib import Path
+from typing import List, Optional
+import shutil
+import asyncio
+import zipfile
+
+from conversion import convert_midi_to_musicxml
+from jobs import PROCESSED_DIR, storage, update_job
+
+async def run_subprocess(cmd: List[str]):
+    """Run a command to completion and return (returncode, stdout, stderr).
+
+    The child gets its own process group; if the awaiting task is cancelled
+    (job cancel or deadline) the whole group is killed before re-raising, so
+    no Demucs/basic-pitch processes outlive their job.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        kill_process_tree(process)
+        await asyncio.shield(process.wait())
+        raise
+    return process.returncode, stdout, stderr
+
+
+def kill_process_tree(process):
+    if process.returncode is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def run_in_thread(func, *args):
+    """``asyncio.to_thread`` that doesn't give up on the thread when cancelled.
+
+    A thread can't be interrupted, so a cancelled job would otherwise carry
+    on while a storage upload or file write is still running, and that write
+    could land after the worker discarded the job's files. On cancellation
+    this waits for the thread to finish before re-raising.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        while not future.done():
+            try:
+                await asyncio.wait({future})
+            except asyncio.CancelledError:
+                continue
+        raise
+
+
+async def probe_duration(audio_path: Path) -> Optional[float]:
+    """Audio duration in seconds via ffprobe, or None if it can't be read"""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        str(audio_path)
+    ]
+    try:
+        returncode, stdout, _ = await asyncio.wait_for(run_subprocess(cmd), timeout=30)
+        if returncode == 0:
+            return float(stdout.decode().strip())
+    except (OSError, ValueError, asyncio.TimeoutError):
+        pass
+    return None
+
+# Processing function
+async def process_audio_to_stems_midi(job_id: str, audio_path: Path, filename: str):
+    """Process audio file: separate stems, convert to MIDI and MusicXML"""
+    try:
+        # Update job status to processing
+        await update_job(
+            job_id,
+            status="processing",
+            progress=10,
+            message="Starting stem separation..."
+        )
+
+        # Create work directory
+        work_dir = PROCESSED_DIR / job_id
+        work_dir.mkdir(exist_ok=True)
+        stems_dir = work_dir / "stems"
+        stems_dir.mkdir(exist_ok=True)
+
+        # Step 1: Separate stems using Demucs
+        await update_job(
+            job_id,
+            progress=20,
+            message="Separating audio into stems (this may take a few minutes)..."
+        )
+
+        # Run Demucs separation
+        demucs_output = work_dir / "demucs_output"
+        python_path = Path(os.environ.get('PYTHON_PATH', sys.executable))
+        demucs_cmd = [
+            str(python_path), "-m", "demucs",
+            "-n", "htdemucs_6s",  # 6-stem model: drums, bass, other, vocals, guitar, piano
+            "-o", str(demucs_output),
+            str(audio_path)
+        ]
+
+        returncode, stdout, stderr = await run_subprocess(demucs_cmd)
+
+        if returncode != 0:
+            raise Exception(f"Demucs failed: {stderr.decode()}")
+
+        # Find the separated stems
+        audio_name = audio_path.stem
+        separated_dir = demucs_output / "htdemucs_6s" / audio_name
+
+        if not separated_dir.exists():
+            raise Exception("Stem separation output not found")
+
+        # Get all stem files
+        stem_files = list(separated_dir.glob("*.wav"))
+        total_stems = len(stem_files)
+
+        await update_job(
+            job_id,
+            progress=50,
+            message=f"Found {total_stems} stems. Converting to MIDI..."
+        )
+
+        # Step 2: Convert each stem to MIDI using basic-pitch
+        midi_dir = work_dir / "midi"
+        midi_dir.mkdir(exist_ok=True)
+        musicxml_dir = work_dir / "musicxml"
+        musicxml_dir.mkdir(exist_ok=True)
+
+        for idx, stem_file in enumerate(stem_files):
+            stem_name = stem_file.stem
+            progress = 50 + int((idx / total_stems) * 40)
+
+            await update_job(
+                job_id,
+                progress=progress,
+                message=f"Converting {stem_name} to MIDI ({idx+1}/{total_stems})..."
+            )
+
+            # Copy stem to stems directory
+            shutil.copy(stem_file, stems_dir / f"{stem_name}.wav")
+
+            # Convert to MIDI using basic-pitch
+            midi_output_dir = midi_dir / stem_name
+            midi_output_dir.mkdir(exist_ok=True)
+
+            basic_pitch_path = python_path.parent / "basic-pitch"
+            basic_pitch_cmd = [
+                str(basic_pitch_path),
+                str(midi_output_dir),
+                str(stem_file)
+            ]
+
+            await run_subprocess(basic_pitch_cmd)
+
+            # Find the generated MIDI file and rename it
+            midi_files = list(midi_output_dir.glob("*.mid"))
+            if midi_files:
+                midi_file = midi_files[0]
+                final_midi = midi_dir / f"{stem_name}.mid"
+                shutil.move(str(midi_file), str(final_midi))
+
+                # Convert MIDI to MusicXML (direct writer for simple stems, music21 otherwise)
+                try:
+                    musicxml_file = musicxml_dir / f"{stem_name}.musicxml"
+                    await run_in_thread(convert_midi_to_musicxml, final_midi, musicxml_file, stem_name)
+                except Exception as e:
+                    logging.warning(f"MusicXML conversion failed for {stem_name}: {e}")
+
+            # Clean up temp directory
+            shutil.rmtree(midi_output_dir, ignore_errors=True)
+
+        # Step 3: Waveform peaks and preview clips for the frontend
+        await update_job(
+            job_id,
+            progress=88,
+            message="Generating stem previews..."
+        )
+
+        previews_dir = work_dir / "previews"
+        try:
+            # Imported here: previews pulls in NumPy at module level
+            from previews import generate_stem_previews
+            preview_levels = await run_in_thread(generate_stem_previews, stems_dir, previews_dir)
+            for preview_file in previews_dir.iterdir():
+                await run_in_thread(storage.put_file, f"processed/{job_id}/previews/{preview_file.name}", preview_file)
+            await update_job(job_id, preview_stems=list(preview_levels), preview_levels=preview_levels)
+        except Exception as e:
+            logging.warning(f"Preview generation failed for job {job_id}: {e}")
+
+        # Step 4: Create ZIP file
+        await update_job(
+            job_id,
+            progress=90,
+            message="Creating download package..."
+        )
+
+        zip_filename = f"{audio_name}_processed.zip"
+        zip_path = work_dir / zip_filename
+
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            # Add stems
+            for stem_file in stems_dir.glob("*.wav"):
+                zipf.write(stem_file, f"stems/{stem_file.name}")
+
+            # Add MIDI files
+            for midi_file in midi_dir.glob("*.mid"):
+                zipf.write(midi_file, f"midi/{midi_file.name}")
+
+            # Add MusicXML files
+            for xml_file in musicxml_dir.glob("*.musicxml"):
+                zipf.write(xml_file, f"musicxml/{xml_file.name}")
+
+        # Publish the package to the artifact store (no-op for local storage)
+        zip_key = f"processed/{job_id}/{zip_filename}"
+        await run_in_thread(storage.put_file, zip_key, zip_path)
+
+        # Update job as completed
+        await update_job(
+            job_id,
+            status="completed",
+            progress=100,
+            message="Processing complete! Your files are ready for download.",
+            output_file=zip_filename
+        )
+
+        # Clean up temporary files
+        shutil.rmtree(demucs_output, ignore_errors=True)
+
+    except Exception as e:
+        logging.error(f"Processing failed for job {job_id}: {str(e)}")
+        await update_job(
+            job_id,
+            status="failed",
+            message=f"Processing failed: {str(e)}"
+        )
@@ -0,0 +1,151 @@
+"""Waveform peaks and preview clips for separated stems.
+
+Runs after separation so the frontend can draw waveforms and audition stems
+without downloading the full WAVs. For each stem we write:
+
+- ``<stem>.peaks.<samples_per_peak>.json``: min/max peaks quantised to int8
+  range, one file per resolution (each 4x coarser than the previous) so the
+  API can serve a single level without parsing anything
+- ``<stem>.mp3``: a short low-bitrate mono clip of the loudest section
+
+Everything is computed with vectorised NumPy; blocking, so run it in a thread.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Finest level: one min/max pair per this many samples (~6ms at 44.1kHz)
+BASE_SAMPLES_PER_PEAK = 256
+PEAK_LEVELS = 4
+LEVEL_FACTOR = 4
+
+PREVIEW_SECONDS = 20
+PREVIEW_SAMPLE_RATE = 22050
+PREVIEW_BITRATE_KBPS = 64
+PREVIEW_FADE_SECONDS = 0.5
+
+
+def load_mono(path: Path) -> Tuple[np.ndarray, int]:
+    """Read an audio file as mono float32 in [-1, 1]"""
+    import soundfile
+
+    samples, sample_rate = soundfile.read(str(path), dtype="float32", always_2d=True)
+    return samples.mean(axis=1), sample_rate
+
+
+def _pad_to_multiple(values: np.ndarray, size: int) -> np.ndarray:
+    remainder = len(values) % size
+    if remainder:
+        values = np.concatenate([values, np.full(size - remainder, values[-1], dtype=values.dtype)])
+    return values
+
+
+def compute_peaks(samples: np.ndarray, base_samples_per_peak: int = BASE_SAMPLES_PER_PEAK,
+                  levels: int = PEAK_LEVELS, factor: int = LEVEL_FACTOR) -> List[dict]:
+    """Min/max peaks at ``levels`` resolutions, finest first.
+
+    The finest level reduces the samples in fixed-size blocks; each coarser
+    level reduces the previous level's peaks, so the signal is scanned once.
+    """
+    if len(samples) == 0:
+        samples = np.zeros(1, dtype=np.float32)
+    blocks = _pad_to_multiple(samples, base_samples_per_peak).reshape(-1, base_samples_per_peak)
+    mins, maxs = blocks.min(axis=1), blocks.max(axis=1)
+
+    result = []
+    samples_per_peak = base_samples_per_peak
+    for level in range(levels):
+        if level:
+            mins = _pad_to_multiple(mins, factor).reshape(-1, factor).min(axis=1)
+            maxs = _pad_to_multiple(maxs, factor).reshape(-1, factor).max(axis=1)
+            samples_per_peak *= factor
+        result.append({
+            "samples_per_peak": samples_per_peak,
+            "min": np.round(np.clip(mins, -1, 1) * 127).astype(np.int8).tolist(),
+            "max": np.round(np.clip(maxs, -1, 1) * 127).astype(np.int8).tolist(),
+        })
+    return result
+
+
+def loudest_window(samples: np.ndarray, sample_rate: int, seconds: float) -> int:
+    """Start sample of the ``seconds``-long window with the most energy"""
+    window = int(seconds * sample_rate)
+    if len(samples) <= window:
+        return 0
+    # Energy per 100ms block, then a sliding sum over the window via cumsum
+    block = max(sample_rate // 10, 1)
+    usable = len(samples) // block * block
+    energy = np.square(samples[:usable], dtype=np.float64).reshape(-1, block).sum(axis=1)
+    blocks_per_window = max(window // block, 1)
+    if len(energy) <= blocks_per_window:
+        return 0
+    totals = np.cumsum(np.concatenate([[0.0], energy]))
+    sums = totals[blocks_per_window:] - totals[:-blocks_per_window]
+    return min(int(np.argmax(sums)) * block, len(samples) - window)
+
+
+def preview_clip(samples: np.ndarray, sample_rate: int, seconds: float = PREVIEW_SECONDS,
+                 target_rate: int = PREVIEW_SAMPLE_RATE) -> Tuple[np.ndarray, int]:
+    """Cut, downsample and fade the preview excerpt; returns int16 samples and their rate"""
+    start = loudest_window(samples, sample_rate, seconds)
+    clip = samples[start:start + int(seconds * sample_rate)]
+
+    # Integer-factor decimation by block averaging (a crude low-pass is
+    # plenty for a 64kbps preview)
+    step = max(sample_rate // target_rate, 1)
+    if step > 1:
+        clip = clip[:len(clip) // step * step].reshape(-1, step).mean(axis=1)
+    rate = sample_rate // step
+
+    fade = min(int(PREVIEW_FADE_SECONDS * rate), len(clip) // 2)
+    if fade:
+        ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+        clip = clip.copy()
+        clip[:fade] *= ramp
+        clip[-fade:] *= ramp[::-1]
+
+    return (np.clip(clip, -1, 1) * 32767).astype(np.int16), rate
+
+
+def encode_mp3(pcm: np.ndarray, sample_rate: int, bitrate_kbps: int = PREVIEW_BITRATE_KBPS) -> bytes:
+    import lameenc
+
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(bitrate_kbps)
+    encoder.set_in_sample_rate(sample_rate)
+    encoder.set_channels(1)
+    encoder.set_quality(7)
+    return bytes(encoder.encode(pcm.tobytes()) + encoder.flush())
+
+
+def generate_stem_previews(stems_dir: Path, previews_dir: Path) -> Dict[str, List[List[int]]]:
+    """Write peaks and preview clips for every stem.
+
+    Returns ``{stem: [[samples_per_peak, peak_count], ...]}`` for the stems
+    done, so the API can pick a level without opening the files.
+    """
+    previews_dir.mkdir(parents=True, exist_ok=True)
+    done = {}
+    for stem_file in sorted(stems_dir.glob("*.wav")):
+        stem_name = stem_file.stem
+        try:
+            samples, sample_rate = load_mono(stem_file)
+            duration = round(len(samples) / sample_rate, 3)
+            levels = []
+            for level in compute_peaks(samples):
+                peaks = {"stem": stem_name, "sample_rate": sample_rate, "duration": duration, **level}
+                peaks_file = previews_dir / f"{stem_name}.peaks.{level['samples_per_peak']}.json"
+                peaks_file.write_text(json.dumps(peaks, separators=(",", ":")))
+                levels.append([level["samples_per_peak"], len(level["max"])])
+
+            pcm, rate = preview_clip(samples, sample_rate)
+            (previews_dir / f"{stem_name}.mp3").write_bytes(encode_mp3(pcm, rate))
+            done[stem_name] = levels
+        except Exception as e:
+            logger.warning(f"Preview generation failed for {stem_name}: {e}")
+    return done
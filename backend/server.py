@@ -1,29 +1,20 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, Request, UploadFile, File, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
-import sys
 import logging
+from typing import Optional
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
-import uuid
-from datetime import datetime, timezone
-import shutil
 import asyncio
-import subprocess
-import tempfile
-import zipfile
+from dataclasses import replace
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Keep this module's imports light: it is the web tier. The processing engine
+# (worker/pipeline/conversion) is only imported when the embedded worker runs.
+from admission import AdmissionLimits, decide
+from jobs import (
+    ProcessingJob, JobStatus, client, db, finish_upload, job_document, queue_ahead_of,
+    release_upload, request_cancel, reserve_upload, storage, worker_capacity
+)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -31,214 +22,35 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Create directories for file storage
-UPLOADS_DIR = Path(os.environ.get('UPLOADS_DIR', ROOT_DIR / '../uploads'))
-PROCESSED_DIR = Path(os.environ.get('PROCESSED_DIR', ROOT_DIR / '../processed'))
-UPLOADS_DIR.mkdir(exist_ok=True)
-PROCESSED_DIR.mkdir(exist_ok=True)
+# Run the processing worker inside the API process (single-box deployments).
+# Set EMBEDDED_WORKER=0 on API pods and run worker.py separately.
+EMBEDDED_WORKER = os.environ.get('EMBEDDED_WORKER', '1') == '1'
 
-# Define Models
-class ProcessingJob(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    filename: str
-    status: str  # pending, processing, completed, failed
-    progress: int = 0
-    message: str = ""
-    output_file: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+ADMISSION_LIMITS = AdmissionLimits.from_env()
 
-class JobStatus(BaseModel):
-    id: str
-    filename: str
-    status: str
-    progress: int
-    message: str
-    output_file: Optional[str] = None
-
-# Processing function
-async def process_audio_to_stems_midi(job_id: str, audio_path: Path, filename: str):
-    """Process audio file: separate stems, convert to MIDI and MusicXML"""
-    try:
-        # Update job status to processing
-        await db.jobs.update_one(
-            {"id": job_id},
-            {"$set": {
-                "status": "processing",
-                "progress": 10,
-                "message": "Starting stem separation...",
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-        
-        # Create work directory
-        work_dir = PROCESSED_DIR / job_id
-        work_dir.mkdir(exist_ok=True)
-        stems_dir = work_dir / "stems"
-        stems_dir.mkdir(exist_ok=True)
-        
-        # Step 1: Separate stems using Demucs
-        await db.jobs.update_one(
-            {"id": job_id},
-            {"$set": {
-                "progress": 20,
-                "message": "Separating audio into stems (this may take a few minutes)...",
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-        
-        # Run Demucs separation
-        demucs_output = work_dir / "demucs_output"
-        python_path = Path(os.environ.get('PYTHON_PATH', sys.executable))
-        demucs_cmd = [
-            str(python_path), "-m", "demucs",
-            "-n", "htdemucs_6s",  # 6-stem model: drums, bass, other, vocals, guitar, piano
-            "-o", str(demucs_output),
-            str(audio_path)
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *demucs_cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode != 0:
-            raise Exception(f"Demucs failed: {stderr.decode()}")
-        
-        # Find the separated stems
-        audio_name = audio_path.stem
-        separated_dir = demucs_output / "htdemucs_6s" / audio_name
-        
-        if not separated_dir.exists():
-            raise Exception("Stem separation output not found")
-        
-        # Get all stem files
-        stem_files = list(separated_dir.glob("*.wav"))
-        total_stems = len(stem_files)
-        
-        await db.jobs.update_one(
-            {"id": job_id},
-            {"$set": {
-                "progress": 50,
-                "message": f"Found {total_stems} stems. Converting to MIDI...",
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-        
-        # Step 2: Convert each stem to MIDI using basic-pitch
-        midi_dir = work_dir / "midi"
-        midi_dir.mkdir(exist_ok=True)
-        musicxml_dir = work_dir / "musicxml"
-        musicxml_dir.mkdir(exist_ok=True)
-        
-        for idx, stem_file in enumerate(stem_files):
-            stem_name = stem_file.stem
-            progress = 50 + int((idx / total_stems) * 40)
-            
-            await db.jobs.update_one(
-                {"id": job_id},
-                {"$set": {
-                    "progress": progress,
-                    "message": f"Converting {stem_name} to MIDI ({idx+1}/{total_stems})...",
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }}
-            )
-            
-            # Copy stem to stems directory
-            shutil.copy(stem_file, stems_dir / f"{stem_name}.wav")
-            
-            # Convert to MIDI using basic-pitch
-            midi_output_dir = midi_dir / stem_name
-            midi_output_dir.mkdir(exist_ok=True)
-            
-            basic_pitch_path = python_path.parent / "basic-pitch"
-            basic_pitch_cmd = [
-                str(basic_pitch_path),
-                str(midi_output_dir),
-                str(stem_file)
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *basic_pitch_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
-            
-            # Find the generated MIDI file and rename it
-            midi_files = list(midi_output_dir.glob("*.mid"))
-            if midi_files:
-                midi_file = midi_files[0]
-                final_midi = midi_dir / f"{stem_name}.mid"
-                shutil.move(str(midi_file), str(final_midi))
-                
-                # Convert MIDI to MusicXML using music21
-                try:
-                    from music21 import converter
-                    score = converter.parse(str(final_midi))
-                    musicxml_file = musicxml_dir / f"{stem_name}.musicxml"
-                    score.write('musicxml', fp=str(musicxml_file))
-                except Exception as e:
-                    logging.warning(f"MusicXML conversion failed for {stem_name}: {e}")
-            
-            # Clean up temp directory
-            shutil.rmtree(midi_output_dir, ignore_errors=True)
-        
-        # Step 3: Create ZIP file
-        await db.jobs.update_one(
-            {"id": job_id},
-            {"$set": {
-                "progress": 90,
-                "message": "Creating download package...",
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-        
-        zip_filename = f"{audio_name}_processed.zip"
-        zip_path = work_dir / zip_filename
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Add stems
-            for stem_file in stems_dir.glob("*.wav"):
-                zipf.write(stem_file, f"stems/{stem_file.name}")
-            
-            # Add MIDI files
-            for midi_file in midi_dir.glob("*.mid"):
-                zipf.write(midi_file, f"midi/{midi_file.name}")
-            
-            # Add MusicXML files
-            for xml_file in musicxml_dir.glob("*.musicxml"):
-                zipf.write(xml_file, f"musicxml/{xml_file.name}")
-        
-        # Update job as completed
-        await db.jobs.update_one(
-            {"id": job_id},
-            {"$set": {
-                "status": "completed",
-                "progress": 100,
-                "message": "Processing complete! Your files are ready for download.",
-                "output_file": zip_filename,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-        
-        # Clean up temporary files
-        shutil.rmtree(demucs_output, ignore_errors=True)
-        
-    except Exception as e:
-        logging.error(f"Processing failed for job {job_id}: {str(e)}")
-        await db.jobs.update_one(
-            {"id": job_id},
-            {"$set": {
-                "status": "failed",
-                "message": f"Processing failed: {str(e)}",
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+async def check_admission(reservation: dict, upload_size=None):
+    """Decide whether the cluster can take the reserved upload right now.
+    
+    Job slots, free memory and disk come from worker heartbeats, not this
+    host: with EMBEDDED_WORKER=0 or remote storage the API host is neither
+    where Demucs runs nor where stems are written. With no live heartbeat the
+    slot count falls back to ADMISSION_MAX_IN_FLIGHT and the memory and disk
+    checks are skipped.
+    """
+    queue_depth = await queue_ahead_of(reservation)
+    in_flight = await db.jobs.count_documents({"status": "processing"})
+    slots, free_memory, free_disk = await worker_capacity()
+    limits = ADMISSION_LIMITS
+    if slots:
+        limits = replace(limits, max_in_flight=slots)
+    return decide(
+        limits,
+        queue_depth=queue_depth,
+        in_flight=in_flight,
+        free_memory=free_memory,
+        free_disk=free_disk,
+        upload_size=upload_size
+    )
 
 # API Routes
 @api_router.get("/")
@@ -246,7 +58,7 @@ async def root():
     return {"message": "Audio to MIDI Converter API"}
 
 @api_router.post("/upload")
-async def upload_audio(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
+async def upload_audio(request: Request, file: UploadFile = File(...)):
     """Upload audio file and start processing"""
     try:
         # Validate file type
@@ -256,32 +68,42 @@ async def upload_audio(file: UploadFile = File(...), background_tasks: Backgroun
         if file_ext not in allowed_extensions:
             raise HTTPException(status_code=400, detail=f"File type {file_ext} not supported. Allowed: {', '.join(allowed_extensions)}")
         
-        # Create job
-        job_id = str(uuid.uuid4())
+        # Use the job reserved by admission control, if any
+        job_id = getattr(request.state, "job_id", None)
         job = ProcessingJob(
-            id=job_id,
             filename=file.filename,
             status="pending",
             progress=0,
             message="File uploaded, waiting to process..."
         )
+        if job_id:
+            job.id = job_id
+        job.upload_file = f"{job.id}{file_ext}"
         
-        # Save to database
-        job_dict = job.model_dump()
-        job_dict['created_at'] = job_dict['created_at'].isoformat()
-        job_dict['updated_at'] = job_dict['updated_at'].isoformat()
-        await db.jobs.insert_one(job_dict)
-        
-        # Save uploaded file
-        upload_path = UPLOADS_DIR / f"{job_id}{file_ext}"
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Stream the upload into storage before the job becomes visible to workers
+        await asyncio.to_thread(storage.save_stream, f"uploads/{job.upload_file}", file.file)
         
-        # Start processing in background
-        background_tasks.add_task(process_audio_to_stems_midi, job_id, upload_path, file.filename)
+        # Save to database; a worker picks up pending jobs
+        if job_id:
+            if not await finish_upload(job_id, job.filename, job.upload_file):
+                # Expired and reaped mid-upload: nothing will ever process it
+                await asyncio.to_thread(storage.delete_prefix, f"uploads/{job.id}")
+                raise Exception("Upload reservation expired")
+        else:
+            await db.jobs.insert_one(job_document(job))
         
-        return {"job_id": job_id, "message": "File uploaded successfully. Processing started."}
+        admission = getattr(request.state, "admission", None)
+        if admission is None:
+            return {"job_id": job.id, "message": "File uploaded successfully. Processing started."}
+        return {
+            "job_id": job.id,
+            "message": admission.message,
+            "queue_position": admission.queue_position,
+            "eta_seconds": admission.eta_seconds
+        }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -296,6 +118,27 @@ async def get_job_status(job_id: str):
     
     return JobStatus(**job)
 
+@api_router.post("/cancel/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = await request_cancel(job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if job["status"] in ("completed", "failed"):
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    
+    if job["status"] == "cancelled":
+        # Never reached a worker: free the upload here. Running jobs are
+        # stopped and cleaned up by the worker that owns them.
+        try:
+            await asyncio.to_thread(storage.delete_prefix, f"uploads/{job_id}")
+        except Exception as e:
+            logging.warning(f"Removing upload for cancelled job {job_id} failed: {e}")
+    
+    return JobStatus(**job)
+
 @api_router.get("/download/{job_id}")
 async def download_result(job_id: str):
     """Download the processed ZIP file"""
@@ -310,17 +153,129 @@ async def download_result(job_id: str):
     if not job.get("output_file"):
         raise HTTPException(status_code=404, detail="Output file not found")
     
-    zip_path = PROCESSED_DIR / job_id / job["output_file"]
+    zip_key = f"processed/{job_id}/{job['output_file']}"
     
-    if not zip_path.exists():
+    if not await asyncio.to_thread(storage.exists, zip_key):
         raise HTTPException(status_code=404, detail="File not found on server")
     
+    zip_path = storage.local_path(zip_key)
+    if zip_path is None:
+        # Remote storage: send the client straight to the object store
+        url = await asyncio.to_thread(storage.download_url, zip_key, job["output_file"])
+        return RedirectResponse(url, status_code=307)
+    
     return FileResponse(
         path=str(zip_path),
         filename=job["output_file"],
         media_type="application/zip"
     )
 
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Shed upload load before the request body is read.
+    
+    Each upload first reserves its place in the queue (an ``uploading`` job),
+    so a burst of concurrent uploads is counted in full rather than each one
+    seeing only the jobs whose bodies have already finished streaming.
+    """
+    if not (request.method == "POST" and request.url.path == "/api/upload"):
+        return await call_next(request)
+    
+    content_length = request.headers.get("content-length")
+    reservation = None
+    try:
+        reservation = await reserve_upload()
+        decision = await check_admission(reservation, int(content_length) if content_length else None)
+    except Exception as e:
+        # Never block uploads because the load probe itself failed
+        logging.warning(f"Admission check failed, admitting upload: {e}")
+        decision = None
+    
+    try:
+        if decision is not None and not decision.accepted:
+            return JSONResponse(
+                status_code=decision.status_code,
+                content={"detail": decision.message, "retry_after": decision.retry_after},
+                headers={"Retry-After": str(decision.retry_after)}
+            )
+        request.state.admission = decision
+        if reservation:
+            request.state.job_id = reservation["id"]
+        return await call_next(request)
+    finally:
+        # No-op once the upload became a pending job
+        if reservation:
+            try:
+                await release_upload(reservation["id"])
+            except Exception as e:
+                logging.warning(f"Releasing upload reservation {reservation['id']} failed: {e}")
+
+async def get_preview_job(job_id: str, stem: str) -> dict:
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if stem not in job.get("preview_stems", []):
+        raise HTTPException(status_code=404, detail="Preview not found")
+    
+    return job
+
+@api_router.get("/peaks/{job_id}/{stem}")
+async def get_stem_peaks(job_id: str, stem: str, width: Optional[int] = Query(None, gt=0)):
+    """Waveform peaks for one stem at a single resolution.
+    
+    Serves the coarsest level with at least ``width`` peaks (the finest level
+    when omitted) as int8-scaled min/max arrays, straight from its file.
+    """
+    job = await get_preview_job(job_id, stem)
+    
+    levels = job.get("preview_levels", {}).get(stem)
+    if not levels:
+        raise HTTPException(status_code=404, detail="Preview not found")
+    
+    samples_per_peak = levels[0][0]
+    if width:
+        for candidate, peak_count in levels:
+            if peak_count >= width:
+                samples_per_peak = candidate
+    
+    key = f"processed/{job_id}/previews/{stem}.peaks.{samples_per_peak}.json"
+    headers = {"Cache-Control": "public, max-age=86400"}
+    peaks_path = storage.local_path(key)
+    if peaks_path is None:
+        try:
+            body = await asyncio.to_thread(storage.read_bytes, key)
+        except Exception:
+            raise HTTPException(status_code=404, detail="Preview not found")
+        return Response(content=body, media_type="application/json", headers=headers)
+    
+    if not peaks_path.exists():
+        raise HTTPException(status_code=404, detail="Preview not found")
+    
+    return FileResponse(path=str(peaks_path), media_type="application/json", headers=headers)
+
+@api_router.get("/preview/{job_id}/{stem}")
+async def get_stem_preview(job_id: str, stem: str):
+    """Short low-bitrate MP3 preview of one stem"""
+    await get_preview_job(job_id, stem)
+    
+    key = f"processed/{job_id}/previews/{stem}.mp3"
+    
+    if not await asyncio.to_thread(storage.exists, key):
+        raise HTTPException(status_code=404, detail="Preview not found")
+    
+    preview_path = storage.local_path(key)
+    if preview_path is None:
+        url = await asyncio.to_thread(storage.download_url, key, f"{stem}.mp3")
+        return RedirectResponse(url, status_code=307)
+    
+    return FileResponse(
+        path=str(preview_path),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -339,6 +294,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_embedded_worker():
+    if EMBEDDED_WORKER:
+        from worker import worker_loop
+        app.state.worker_task = asyncio.create_task(worker_loop())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    worker_task = getattr(app.state, "worker_task", None)
+    if worker_task:
+        # Let running jobs hand themselves back before the client closes
+        worker_task.cancel()
+        await asyncio.gather(worker_task, return_exceptions=True)
     client.close()
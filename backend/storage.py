@@ -0,0 +1,199 @@
+"""Artifact storage for uploads and processed outputs.
+
+Keys look like ``uploads/<job_id>.mp3`` or ``processed/<job_id>/<file>``.
+``LocalStorage`` maps them onto UPLOADS_DIR / PROCESSED_DIR (the original
+single-host layout); ``S3Storage`` keeps them in an S3-compatible bucket so any
+API node can serve any job. Select with ``STORAGE_BACKEND=local|s3``.
+
+All methods are blocking; call them through ``asyncio.to_thread`` from async
+code.
+"""
+import os
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+# Part size for S3 multipart uploads
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class Storage(ABC):
+    """Interface shared by the storage backends"""
+
+    @abstractmethod
+    def save_stream(self, key: str, fileobj: BinaryIO):
+        """Stream a file object into storage"""
+
+    @abstractmethod
+    def put_file(self, key: str, path: Path):
+        """Store a local file under key"""
+
+    @abstractmethod
+    def fetch(self, key: str, dest: Path) -> Path:
+        """Return a local path holding the object, downloading it to dest if needed"""
+
+    @abstractmethod
+    def read_bytes(self, key: str) -> bytes:
+        """Whole object contents"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether an object is stored under key"""
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        """Delete every object whose key starts with prefix"""
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Path of the object on this host's filesystem, if the backend is local"""
+        return None
+
+    def download_url(self, key: str, filename: str, expires: int = 3600) -> Optional[str]:
+        """Time-limited URL clients can download the object from directly"""
+        return None
+
+
+class LocalStorage(Storage):
+    """Objects live on the local filesystem, one root directory per key prefix"""
+
+    def __init__(self, roots: Dict[str, Path]):
+        self.roots = {name: Path(root) for name, root in roots.items()}
+
+    def _path(self, key: str) -> Path:
+        root_name, _, rest = key.partition("/")
+        if root_name not in self.roots or not rest:
+            raise ValueError(f"Unknown storage key: {key}")
+        root = self.roots[root_name].resolve()
+        path = (root / rest).resolve()
+        if root != path and root not in path.parents:
+            raise ValueError(f"Storage key escapes its root: {key}")
+        return path
+
+    def save_stream(self, key: str, fileobj: BinaryIO):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as buffer:
+            shutil.copyfileobj(fileobj, buffer)
+
+    def put_file(self, key: str, path: Path):
+        target = self._path(key)
+        if Path(path).resolve() == target:
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, target)
+
+    def fetch(self, key: str, dest: Path) -> Path:
+        return self._path(key)
+
+    def read_bytes(self, key: str) -> bytes:
+        return self._path(key).read_bytes()
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def delete_prefix(self, prefix: str):
+        path = self._path(prefix.rstrip("/"))
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            for match in path.parent.glob(f"{path.name}*"):
+                if match.is_dir():
+                    shutil.rmtree(match, ignore_errors=True)
+                else:
+                    match.unlink(missing_ok=True)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+
+class S3Storage(Storage):
+    """Objects live in an S3-compatible bucket (AWS S3, MinIO, ...)"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url
+        self._client = client
+
+    @property
+    def client(self):
+        # boto3 is imported on first use so the API import stays cheap
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _transfer_kwargs(self) -> dict:
+        try:
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            return {}
+        return {"Config": TransferConfig(
+            multipart_threshold=MULTIPART_CHUNK_SIZE,
+            multipart_chunksize=MULTIPART_CHUNK_SIZE
+        )}
+
+    def save_stream(self, key: str, fileobj: BinaryIO):
+        # upload_fileobj reads the stream in chunks and switches to a
+        # multipart upload past the threshold, so nothing is buffered whole
+        self.client.upload_fileobj(fileobj, self.bucket, self._key(key), **self._transfer_kwargs())
+
+    def put_file(self, key: str, path: Path):
+        with open(path, "rb") as fileobj:
+            self.save_stream(key, fileobj)
+
+    def fetch(self, key: str, dest: Path) -> Path:
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with open(dest, "wb") as fileobj:
+            self.client.download_fileobj(self.bucket, self._key(key), fileobj, **self._transfer_kwargs())
+        return dest
+
+    def read_bytes(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def delete_prefix(self, prefix: str):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            objects = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects})
+
+    def download_url(self, key: str, filename: str, expires: int = 3600) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self._key(key),
+                "ResponseContentDisposition": f'attachment; filename="{filename}"'
+            },
+            ExpiresIn=expires
+        )
+
+
+def create_storage(uploads_dir: Path, processed_dir: Path) -> Storage:
+    """Build the storage backend selected by STORAGE_BACKEND"""
+    backend = os.environ.get('STORAGE_BACKEND', 'local').lower()
+    if backend == 'local':
+        return LocalStorage({"uploads": uploads_dir, "processed": processed_dir})
+    if backend == 's3':
+        return S3Storage(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.environ.get('S3_PREFIX', ''),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Backend modules are imported flat (``uvicorn server:app`` runs from backend/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# jobs.py reads these at import time; Motor doesn't connect until first use
+os.environ.setdefault('MONGO_URL', 'mongodb://127.0.0.1:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
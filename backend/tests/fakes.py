@@ -0,0 +1,125 @@
+"""In-memory stand-ins for the Motor collections the job helpers use.
+
+Supports the query operators jobs.py relies on ($and, $or, $lt, $lte, $gt,
+$gte, $ne, $in) and nothing more; documents come back as copies, like Motor.
+"""
+from types import SimpleNamespace
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict) and cond and all(op.startswith("$") for op in cond):
+            value = doc.get(key)
+            for op, operand in cond.items():
+                if op == "$ne":
+                    ok = value != operand
+                elif op == "$in":
+                    ok = value in operand
+                elif value is None:
+                    ok = False
+                elif op == "$lt":
+                    ok = value < operand
+                elif op == "$lte":
+                    ok = value <= operand
+                elif op == "$gt":
+                    ok = value > operand
+                elif op == "$gte":
+                    ok = value >= operand
+                else:
+                    raise NotImplementedError(op)
+                if not ok:
+                    return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    doc = {key: value for key, value in doc.items() if key != "_id"}
+    included = [key for key, value in (projection or {}).items() if value and key != "_id"]
+    if included:
+        doc = {key: doc[key] for key in included if key in doc}
+    return doc
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, *docs):
+        self.docs = [dict(doc) for doc in docs]
+
+    def _matching(self, query, sort=None):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+        return found
+
+    def get(self, doc_id):
+        """The stored document with this id (test helper, not Motor API)"""
+        return next((doc for doc in self.docs if doc.get("id") == doc_id), None)
+
+    async def insert_one(self, doc):
+        doc["_id"] = len(self.docs) + 1
+        self.docs.append(dict(doc))
+
+    async def find_one(self, query, projection=None, sort=None):
+        found = self._matching(query, sort)
+        return _project(found[0], projection) if found else None
+
+    def find(self, query, projection=None):
+        return _Cursor([_project(doc, projection) for doc in self._matching(query)])
+
+    async def count_documents(self, query):
+        return len(self._matching(query))
+
+    async def find_one_and_update(self, query, update, projection=None, sort=None, **kwargs):
+        found = self._matching(query, sort)
+        if not found:
+            return None
+        found[0].update(update["$set"])
+        return _project(found[0], projection)
+
+    async def update_one(self, query, update, upsert=False):
+        found = self._matching(query)
+        if found:
+            found[0].update(update["$set"])
+        elif upsert:
+            await self.insert_one(dict(update["$set"]))
+        return SimpleNamespace(modified_count=1 if found else 0)
+
+    async def delete_one(self, query):
+        found = self._matching(query)
+        if found:
+            self.docs.remove(found[0])
+        return SimpleNamespace(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query):
+        found = self._matching(query)
+        for doc in found:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(found))
+
+
+class FakeDB:
+    def __init__(self, *jobs, workers=()):
+        self.jobs = FakeCollection(*jobs)
+        self.workers = FakeCollection(*workers)
@@ -0,0 +1,52 @@
+from admission import MB, AdmissionLimits, decide
+
+LIMITS = AdmissionLimits(max_in_flight=2, max_queue_depth=4, min_free_memory_mb=512,
+                         min_free_disk_mb=1024, avg_job_seconds=100)
+PLENTY = 64 * 1024 * MB
+
+
+def test_idle_server_starts_immediately():
+    decision = decide(LIMITS, queue_depth=0, in_flight=0, free_memory=PLENTY, free_disk=PLENTY)
+    assert decision.accepted
+    assert decision.queue_position == 0
+    assert decision.eta_seconds == 100
+
+
+def test_busy_server_queues_with_eta():
+    decision = decide(LIMITS, queue_depth=2, in_flight=2, free_memory=PLENTY, free_disk=PLENTY)
+    assert decision.accepted
+    assert decision.queue_position == 3
+    # Two waves of two slots ahead, then the job itself
+    assert decision.eta_seconds == 300
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    decision = decide(LIMITS, queue_depth=4, in_flight=2, free_memory=PLENTY, free_disk=PLENTY)
+    assert not decision.accepted
+    assert decision.status_code == 429
+    assert decision.retry_after == 50
+
+
+def test_low_resources_return_503():
+    low_memory = decide(LIMITS, queue_depth=0, in_flight=0, free_memory=100 * MB, free_disk=PLENTY)
+    assert (low_memory.accepted, low_memory.status_code) == (False, 503)
+
+    # The upload itself would eat into the disk reserve
+    low_disk = decide(LIMITS, queue_depth=0, in_flight=0, free_memory=PLENTY,
+                      free_disk=1100 * MB, upload_size=200 * MB)
+    assert (low_disk.accepted, low_disk.status_code) == (False, 503)
+    assert low_disk.retry_after
+
+
+def test_low_memory_from_running_jobs_still_queues():
+    # A running job holds the memory; the new one would wait for its slot anyway
+    decision = decide(LIMITS, queue_depth=0, in_flight=2, free_memory=100 * MB, free_disk=PLENTY)
+    assert decision.accepted
+    assert decision.queue_position == 1
+    assert decision.eta_seconds == 200
+
+
+def test_zero_limits_disable_checks():
+    limits = AdmissionLimits(max_in_flight=1, max_queue_depth=0, min_free_memory_mb=0, min_free_disk_mb=0)
+    decision = decide(limits, queue_depth=1000, in_flight=1, free_memory=0, free_disk=0)
+    assert decision.accepted
@@ -0,0 +1,258 @@
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("motor")
+
+import jobs
+import worker
+from pipeline import run_in_thread, run_subprocess
+from storage import LocalStorage
+
+from fakes import FakeDB
+
+
+def test_cancelled_subprocess_is_killed():
+    async def scenario():
+        task = asyncio.create_task(run_subprocess([sys.executable, '-c', 'import time; time.sleep(30)']))
+        await asyncio.sleep(0.5)
+        started = time.monotonic()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 5
+
+
+def test_cancelled_thread_work_finishes_before_cancel_propagates():
+    landed = []
+
+    def slow_upload():
+        time.sleep(0.3)
+        landed.append(True)
+
+    async def scenario():
+        task = asyncio.create_task(run_in_thread(slow_upload))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Cleanup after the cancel sees everything the thread wrote
+        return list(landed)
+
+    assert asyncio.run(scenario()) == [True]
+
+
+def test_deadline_scales_with_duration(monkeypatch):
+    monkeypatch.setattr(worker, 'JOB_DEADLINE_BASE_SECONDS', 300)
+    monkeypatch.setattr(worker, 'JOB_DEADLINE_PER_AUDIO_SECOND', 6)
+    monkeypatch.setattr(worker, 'JOB_DEADLINE_MAX_SECONDS', 1800)
+
+    assert worker.job_deadline_seconds(60) == 660
+    assert worker.job_deadline_seconds(600) == 1800
+    assert worker.job_deadline_seconds(None) == 1800
+
+
+def test_request_cancel_by_status(monkeypatch):
+    fake = FakeDB(
+        {"id": "queued", "status": "pending"},
+        {"id": "running", "status": "processing"},
+        {"id": "done", "status": "completed"},
+    )
+    monkeypatch.setattr(jobs, 'db', fake)
+
+    async def scenario():
+        return [await jobs.request_cancel(job_id) for job_id in ("queued", "running", "done", "missing")]
+
+    queued, running, done, missing = asyncio.run(scenario())
+    # Queued jobs are cancelled outright; running ones are flagged for their worker
+    assert queued["status"] == "cancelled"
+    assert running["status"] == "processing" and running["cancel_requested"]
+    assert done["status"] == "completed" and not done.get("cancel_requested")
+    assert missing is None
+
+
+@pytest.fixture
+def job_env(tmp_path, monkeypatch):
+    """A claimed job with its upload and partial outputs on local storage"""
+    uploads, processed = tmp_path / "uploads", tmp_path / "processed"
+    uploads.mkdir()
+    (processed / "job1" / "stems").mkdir(parents=True)
+    (uploads / "job1.wav").write_bytes(b"audio")
+    (processed / "job1" / "stems" / "bass.wav").write_bytes(b"partial")
+
+    fake = FakeDB({"id": "job1", "status": "processing", "filename": "song.wav", "upload_file": "job1.wav"})
+    monkeypatch.setattr(jobs, 'db', fake)
+    monkeypatch.setattr(worker, 'db', fake)
+    monkeypatch.setattr(worker, 'storage', LocalStorage({"uploads": uploads, "processed": processed}))
+    monkeypatch.setattr(worker, 'PROCESSED_DIR', processed)
+    monkeypatch.setattr(worker, 'CANCEL_POLL_SECONDS', 0.01)
+
+    async def no_duration(audio_path):
+        return None
+    monkeypatch.setattr(worker, 'probe_duration', no_duration)
+
+    return fake, uploads, processed
+
+
+def _stub_pipeline(monkeypatch, on_cancel=None):
+    """Replace the pipeline with one that runs until cancelled"""
+    seen = {}
+
+    async def pipeline(job_id, audio_path, filename):
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            seen["cancelled"] = True
+            if on_cancel is None:
+                raise
+            await on_cancel(job_id)
+
+    monkeypatch.setattr(worker, 'process_audio_to_stems_midi', pipeline)
+    return seen
+
+
+def test_cancel_stops_running_job_and_discards_files(job_env, monkeypatch):
+    fake, uploads, processed = job_env
+    seen = _stub_pipeline(monkeypatch)
+    monkeypatch.setattr(worker, 'job_deadline_seconds', lambda duration: 60)
+
+    async def scenario():
+        run = asyncio.create_task(worker.run_job(dict(fake.jobs.get("job1"))))
+        await asyncio.sleep(0.05)
+        await jobs.request_cancel("job1")
+        await asyncio.wait_for(run, timeout=5)
+
+    asyncio.run(scenario())
+
+    assert seen.get("cancelled")
+    assert fake.jobs.get("job1")["status"] == "cancelled"
+    assert not (uploads / "job1.wav").exists()
+    assert not (processed / "job1").exists()
+
+
+def test_deadline_fails_job_and_discards_files(job_env, monkeypatch):
+    fake, uploads, processed = job_env
+    seen = _stub_pipeline(monkeypatch)
+    monkeypatch.setattr(worker, 'job_deadline_seconds', lambda duration: 0.1)
+
+    asyncio.run(asyncio.wait_for(worker.run_job(dict(fake.jobs.get("job1"))), timeout=5))
+
+    job = fake.jobs.get("job1")
+    assert seen.get("cancelled")
+    assert job["status"] == "failed"
+    assert "time limit" in job["message"]
+    assert job["deadline_at"]
+    assert not (uploads / "job1.wav").exists()
+    assert not (processed / "job1").exists()
+
+
+def test_job_finishing_as_cancel_lands_is_kept(job_env, monkeypatch):
+    fake, uploads, processed = job_env
+
+    async def finish(job_id):
+        # The pipeline completes instead of propagating the cancellation
+        await jobs.update_job(job_id, status="completed", progress=100)
+
+    _stub_pipeline(monkeypatch, on_cancel=finish)
+    monkeypatch.setattr(worker, 'job_deadline_seconds', lambda duration: 0.1)
+
+    asyncio.run(asyncio.wait_for(worker.run_job(dict(fake.jobs.get("job1"))), timeout=5))
+
+    assert fake.jobs.get("job1")["status"] == "completed"
+    assert (uploads / "job1.wav").exists()
+    assert (processed / "job1" / "stems" / "bass.wav").exists()
+
+
+def test_worker_shutdown_hands_jobs_back(job_env, monkeypatch):
+    fake, uploads, processed = job_env
+    seen = _stub_pipeline(monkeypatch)
+    monkeypatch.setattr(worker, 'job_deadline_seconds', lambda duration: 60)
+
+    async def scenario():
+        run = asyncio.create_task(worker.run_job(dict(fake.jobs.get("job1"))))
+        await asyncio.sleep(0.05)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+
+    asyncio.run(scenario())
+
+    # Back in the queue for another worker, upload kept
+    job = fake.jobs.get("job1")
+    assert seen.get("cancelled")
+    assert job["status"] == "pending"
+    assert job["deadline_at"] is None
+    assert (uploads / "job1.wav").exists()
+
+
+def test_worker_shutdown_finishes_requested_cancel(job_env, monkeypatch):
+    fake, uploads, processed = job_env
+    _stub_pipeline(monkeypatch)
+    monkeypatch.setattr(worker, 'job_deadline_seconds', lambda duration: 60)
+    monkeypatch.setattr(worker, 'CANCEL_POLL_SECONDS', 30)
+
+    async def scenario():
+        run = asyncio.create_task(worker.run_job(dict(fake.jobs.get("job1"))))
+        await asyncio.sleep(0.05)
+        await jobs.request_cancel("job1")
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+
+    asyncio.run(scenario())
+
+    assert fake.jobs.get("job1")["status"] == "cancelled"
+    assert not (uploads / "job1.wav").exists()
+
+
+def test_claim_sets_provisional_deadline(monkeypatch):
+    fake = FakeDB({"id": "job1", "status": "pending", "created_at": "2026-01-01T00:00:00+00:00"})
+    monkeypatch.setattr(jobs, 'db', fake)
+
+    job = asyncio.run(jobs.claim_next_job(600))
+
+    assert job["status"] == "processing"
+    assert job["deadline_at"] > datetime.now(timezone.utc).isoformat()
+
+
+def test_reaper_finishes_abandoned_jobs(tmp_path, monkeypatch):
+    long_ago = (datetime.now(timezone.utc) - timedelta(hours=2)).isoformat()
+    soon = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+    fake = FakeDB(
+        # Worker died: deadline long past
+        {"id": "overdue", "status": "processing", "deadline_at": long_ago, "updated_at": long_ago},
+        # Worker died after the user asked to cancel
+        {"id": "orphaned", "status": "processing", "cancel_requested": True,
+         "deadline_at": soon, "updated_at": long_ago},
+        # Healthy: running within its deadline
+        {"id": "running", "status": "processing", "deadline_at": soon, "updated_at": long_ago},
+        {"id": "done", "status": "completed", "deadline_at": long_ago, "updated_at": long_ago},
+    )
+    uploads, processed = tmp_path / "uploads", tmp_path / "processed"
+    uploads.mkdir()
+    processed.mkdir()
+    for job_id in ("overdue", "orphaned", "running"):
+        (uploads / f"{job_id}.wav").write_bytes(b"audio")
+    monkeypatch.setattr(jobs, 'db', fake)
+    monkeypatch.setattr(worker, 'storage', LocalStorage({"uploads": uploads, "processed": processed}))
+    monkeypatch.setattr(worker, 'PROCESSED_DIR', processed)
+
+    async def scenario():
+        reaper = asyncio.create_task(worker.reaper_loop(interval=30, grace=60))
+        await asyncio.sleep(0.05)
+        reaper.cancel()
+
+    asyncio.run(scenario())
+
+    assert fake.jobs.get("overdue")["status"] == "failed"
+    assert fake.jobs.get("orphaned")["status"] == "cancelled"
+    assert fake.jobs.get("running")["status"] == "processing"
+    assert fake.jobs.get("done")["status"] == "completed"
+    assert not (uploads / "overdue.wav").exists()
+    assert not (uploads / "orphaned.wav").exists()
+    assert (uploads / "running.wav").exists()
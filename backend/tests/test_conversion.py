@@ -0,0 +1,44 @@
+import pytest
+
+mido = pytest.importorskip("mido")
+
+from conversion import read_monophonic_notes, write_simple_musicxml
+
+
+def _write_midi(path, notes, ticks_per_beat=480):
+    """Write (start_beat, length_beats, pitch) notes to a single-track MIDI file"""
+    midi = mido.MidiFile(ticks_per_beat=ticks_per_beat)
+    track = mido.MidiTrack()
+    midi.tracks.append(track)
+    events = []
+    for start, length, pitch in notes:
+        events.append((int(start * ticks_per_beat), 'note_on', pitch))
+        events.append((int((start + length) * ticks_per_beat), 'note_off', pitch))
+    tick = 0
+    for at, kind, pitch in sorted(events, key=lambda e: (e[0], e[1] == 'note_on')):
+        track.append(mido.Message(kind, note=pitch, velocity=64, time=at - tick))
+        tick = at
+    midi.save(str(path))
+
+
+def test_direct_writer_handles_monophonic_line(tmp_path):
+    midi_path = tmp_path / 'bass.mid'
+    _write_midi(midi_path, [(0, 1, 40), (1, 1.5, 43), (3, 2, 45)])
+
+    xml_path = tmp_path / 'bass.musicxml'
+    assert write_simple_musicxml(midi_path, xml_path, 'Bass')
+
+    xml = xml_path.read_text()
+    assert '<sign>F</sign>' in xml
+    assert xml.count('<measure ') == 2
+    # The last note crosses the barline and is tied
+    assert '<tie type="start"/>' in xml and '<tie type="stop"/>' in xml
+
+
+def test_direct_writer_rejects_chords(tmp_path):
+    midi_path = tmp_path / 'piano.mid'
+    _write_midi(midi_path, [(0, 2, 60), (0, 2, 64), (0, 2, 67)])
+
+    assert read_monophonic_notes(midi_path) is None
+    assert not write_simple_musicxml(midi_path, tmp_path / 'piano.musicxml', 'Piano')
+    assert not (tmp_path / 'piano.musicxml').exists()
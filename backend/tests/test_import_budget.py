@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Seconds allowed for `import server`; override in slow CI with API_IMPORT_BUDGET_SECONDS
+IMPORT_BUDGET_SECONDS = float(os.environ.get('API_IMPORT_BUDGET_SECONDS', '2.0'))
+
+# Modules that belong to the workers and must never be loaded by the web tier
+HEAVY_MODULES = ['torch', 'tensorflow', 'demucs', 'basic_pitch', 'music21', 'librosa', 'numpy',
+                 'pipeline', 'worker', 'conversion']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import server
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def test_api_import_is_light_and_fast(tmp_path):
+    env = dict(os.environ,
+               MONGO_URL=os.environ.get('MONGO_URL', 'mongodb://127.0.0.1:27017'),
+               DB_NAME=os.environ.get('DB_NAME', 'test_database'),
+               UPLOADS_DIR=str(tmp_path / 'uploads'),
+               PROCESSED_DIR=str(tmp_path / 'processed'),
+               EMBEDDED_WORKER='0')
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    loaded = set(report['modules'])
+    heavy = [name for name in HEAVY_MODULES if name in loaded]
+    assert not heavy, f"server.py imports worker-only modules: {heavy}"
+    assert report['elapsed'] < IMPORT_BUDGET_SECONDS, (
+        f"import server took {report['elapsed']:.2f}s (budget {IMPORT_BUDGET_SECONDS}s)")
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from previews import compute_peaks, loudest_window, preview_clip
+
+
+def test_peaks_match_naive_reduction():
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-1, 1, 10_000).astype(np.float32)
+
+    levels = compute_peaks(samples, base_samples_per_peak=100, levels=3, factor=4)
+    assert [level["samples_per_peak"] for level in levels] == [100, 400, 1600]
+
+    for level in levels:
+        size = level["samples_per_peak"]
+        expected_max = [np.round(samples[i:i + size].max() * 127) for i in range(0, len(samples), size)]
+        expected_min = [np.round(samples[i:i + size].min() * 127) for i in range(0, len(samples), size)]
+        assert level["max"] == expected_max
+        assert level["min"] == expected_min
+
+
+def test_loudest_window_finds_the_burst():
+    sample_rate = 1000
+    samples = np.zeros(60 * sample_rate, dtype=np.float32)
+    samples[40 * sample_rate:45 * sample_rate] = 0.9
+
+    start = loudest_window(samples, sample_rate, seconds=5)
+    assert start == 40 * sample_rate
+
+
+def test_preview_clip_is_short_and_downsampled():
+    sample_rate = 44100
+    samples = np.sin(np.linspace(0, 2000 * np.pi, 60 * sample_rate)).astype(np.float32)
+
+    pcm, rate = preview_clip(samples, sample_rate, seconds=10)
+    assert rate == 22050
+    assert pcm.dtype == np.int16
+    assert len(pcm) == 10 * rate
+    # Faded in and out
+    assert pcm[0] == 0 and pcm[-1] == 0
+
+
+def test_each_peak_level_is_its_own_file(tmp_path):
+    soundfile = pytest.importorskip("soundfile")
+    pytest.importorskip("lameenc")
+    from previews import generate_stem_previews
+
+    stems_dir = tmp_path / "stems"
+    stems_dir.mkdir()
+    sample_rate = 44100
+    tone = 0.5 * np.sin(np.linspace(0, 880 * np.pi, 2 * sample_rate)).astype(np.float32)
+    soundfile.write(str(stems_dir / "bass.wav"), tone, sample_rate)
+
+    levels = generate_stem_previews(stems_dir, tmp_path / "previews")
+    assert [spp for spp, _ in levels["bass"]] == [256, 1024, 4096, 16384]
+
+    for samples_per_peak, peak_count in levels["bass"]:
+        peaks = json.loads((tmp_path / "previews" / f"bass.peaks.{samples_per_peak}.json").read_text())
+        assert peaks["samples_per_peak"] == samples_per_peak
+        assert len(peaks["min"]) == len(peaks["max"]) == peak_count
+    assert (tmp_path / "previews" / "bass.mp3").stat().st_size > 0
@@ -0,0 +1,116 @@
+import io
+from pathlib import Path
+
+import pytest
+
+from storage import MULTIPART_CHUNK_SIZE, LocalStorage, S3Storage, Storage
+
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client we use"""
+
+    class NotFound(Exception):
+        response = {"Error": {"Code": "404"}}
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, fileobj, bucket, key, Config=None):
+        self.objects[(bucket, key)] = fileobj.read()
+
+    def download_fileobj(self, bucket, key, fileobj, Config=None):
+        fileobj.write(self.objects[(bucket, key)])
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.NotFound()
+        return {}
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                keys = [k for b, k in client.objects if b == Bucket and k.startswith(Prefix)]
+                yield {"Contents": [{"Key": k} for k in keys]}
+
+        return Paginator()
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.objects.pop((Bucket, obj["Key"]), None)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def test_local_storage_maps_keys_onto_roots(tmp_path):
+    storage = LocalStorage({"uploads": tmp_path / "up", "processed": tmp_path / "out"})
+
+    storage.save_stream("uploads/job.wav", io.BytesIO(b"audio"))
+    assert (tmp_path / "up" / "job.wav").read_bytes() == b"audio"
+    assert storage.fetch("uploads/job.wav", tmp_path / "ignored") == (tmp_path / "up" / "job.wav").resolve()
+
+    src = tmp_path / "result.zip"
+    src.write_bytes(b"zip")
+    storage.put_file("processed/job/result.zip", src)
+    assert storage.exists("processed/job/result.zip")
+    assert storage.download_url("processed/job/result.zip", "result.zip") is None
+
+    storage.delete_prefix("processed/job/")
+    storage.delete_prefix("uploads/job")
+    assert not storage.exists("processed/job/result.zip")
+    assert not storage.exists("uploads/job.wav")
+
+    with pytest.raises(ValueError):
+        storage.local_path("uploads/../secret")
+
+
+def test_s3_storage_round_trip(tmp_path):
+    client = FakeS3Client()
+    storage = S3Storage("bucket", prefix="mp3stemxml", client=client)
+
+    storage.save_stream("uploads/job.wav", io.BytesIO(b"audio"))
+    assert client.objects[("bucket", "mp3stemxml/uploads/job.wav")] == b"audio"
+
+    dest = storage.fetch("uploads/job.wav", tmp_path / "scratch" / "job.wav")
+    assert dest.read_bytes() == b"audio"
+
+    assert storage.exists("uploads/job.wav")
+    assert not storage.exists("uploads/other.wav")
+    assert storage.local_path("uploads/job.wav") is None
+    assert storage.download_url("uploads/job.wav", "job.wav").startswith("https://s3.test/bucket/mp3stemxml/uploads/")
+
+    storage.delete_prefix("uploads/")
+    assert not client.objects
+
+
+def test_api_requirements_cover_s3_backend():
+    # API pods with STORAGE_BACKEND=s3 build the boto3 client on first use
+    requirements = (Path(__file__).parent.parent / "requirements-api.txt").read_text()
+    pinned = {line.split("==")[0].lower() for line in requirements.splitlines() if "==" in line}
+    assert {"boto3", "botocore", "s3transfer", "jmespath", "python-dateutil", "urllib3"} <= pinned
+
+
+def test_s3_storage_builds_real_client(monkeypatch):
+    pytest.importorskip("boto3")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    storage = S3Storage("bucket", endpoint_url="http://minio.test:9000")
+    assert storage._transfer_kwargs()["Config"].multipart_chunksize == MULTIPART_CHUNK_SIZE
+
+    # Presigning is local, so this exercises the real client without a server
+    url = storage.download_url("processed/job/result.zip", "result.zip")
+    assert url.startswith("http://minio.test:9000/bucket/processed/job/result.zip?")
+    assert "Signature" in url
+
+
+def test_incomplete_backend_fails_at_construction():
+    class PartialStorage(Storage):
+        def save_stream(self, key, fileobj):
+            pass
+
+    with pytest.raises(TypeError):
+        PartialStorage()
@@ -0,0 +1,162 @@
+import asyncio
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+
+from fastapi.testclient import TestClient
+
+import jobs
+import server
+import worker
+from admission import AdmissionLimits
+from storage import LocalStorage
+
+from fakes import FakeDB
+
+LIMITS = AdmissionLimits(max_in_flight=1, max_queue_depth=2, min_free_memory_mb=0,
+                         min_free_disk_mb=0, avg_job_seconds=100)
+
+
+def _ago(seconds):
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """The API app on an in-memory job store and local storage (no embedded worker)"""
+    fake = FakeDB()
+    uploads, processed = tmp_path / "uploads", tmp_path / "processed"
+    uploads.mkdir()
+    processed.mkdir()
+    monkeypatch.setattr(jobs, 'db', fake)
+    monkeypatch.setattr(server, 'db', fake)
+    monkeypatch.setattr(server, 'storage', LocalStorage({"uploads": uploads, "processed": processed}))
+    monkeypatch.setattr(server, 'ADMISSION_LIMITS', LIMITS)
+    return TestClient(server.app), fake, uploads
+
+
+def _upload(client, name="song.wav"):
+    return client.post("/api/upload", files={"file": (name, io.BytesIO(b"audio"), "audio/wav")})
+
+
+def test_concurrent_reservations_get_distinct_queue_depths(monkeypatch):
+    fake = FakeDB({"id": "queued", "status": "pending", "created_at": _ago(60)})
+    monkeypatch.setattr(jobs, 'db', fake)
+
+    async def scenario():
+        reservations = await asyncio.gather(*(jobs.reserve_upload() for _ in range(5)))
+        depths = await asyncio.gather(*(jobs.queue_ahead_of(r) for r in reservations))
+        # Same timestamp: the id breaks the tie, so places stay distinct
+        moment = reservations[0]["created_at"]
+        for doc in fake.jobs.docs + reservations:
+            if doc["status"] == "uploading":
+                doc["created_at"] = moment
+        tied = await asyncio.gather(*(jobs.queue_ahead_of(r) for r in reservations))
+        return depths, tied
+
+    depths, tied = asyncio.run(scenario())
+    assert sorted(depths) == [1, 2, 3, 4, 5]
+    assert sorted(tied) == [1, 2, 3, 4, 5]
+
+
+def test_accepted_upload_becomes_pending_job(api):
+    client, fake, uploads = api
+
+    response = _upload(client)
+
+    assert response.status_code == 200
+    job = fake.jobs.get(response.json()["job_id"])
+    assert job["status"] == "pending"
+    assert job["filename"] == "song.wav"
+    assert (uploads / job["upload_file"]).exists()
+    assert len(fake.jobs.docs) == 1
+
+
+def test_rejected_upload_leaves_no_reservation(api):
+    client, fake, uploads = api
+    fake.jobs.docs = [{"id": f"queued{n}", "status": "pending", "created_at": _ago(60)} for n in range(2)]
+
+    response = _upload(client)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"]
+    assert not [doc for doc in fake.jobs.docs if doc["status"] == "uploading"]
+
+
+def test_invalid_upload_leaves_no_reservation(api):
+    client, fake, uploads = api
+
+    response = _upload(client, name="notes.txt")
+
+    assert response.status_code == 400
+    assert fake.jobs.docs == []
+
+
+def test_failed_upload_leaves_no_reservation(api, monkeypatch):
+    client, fake, uploads = api
+
+    def broken(key, fileobj):
+        raise OSError("disk full")
+    monkeypatch.setattr(server.storage, 'save_stream', broken)
+
+    response = _upload(client)
+
+    assert response.status_code == 500
+    assert fake.jobs.docs == []
+
+
+def test_expired_reservations_are_deleted(tmp_path, monkeypatch):
+    fake = FakeDB(
+        {"id": "stuck", "status": "uploading", "filename": "", "created_at": _ago(7200)},
+        {"id": "streaming", "status": "uploading", "filename": "", "created_at": _ago(10)},
+    )
+    uploads, processed = tmp_path / "uploads", tmp_path / "processed"
+    uploads.mkdir()
+    processed.mkdir()
+    (uploads / "stuck.wav").write_bytes(b"partial")
+    monkeypatch.setattr(jobs, 'db', fake)
+    monkeypatch.setattr(jobs, 'UPLOAD_RESERVATION_SECONDS', 3600)
+    monkeypatch.setattr(worker, 'storage', LocalStorage({"uploads": uploads, "processed": processed}))
+
+    async def scenario():
+        reaper = asyncio.create_task(worker.reaper_loop(interval=30, grace=60))
+        await asyncio.sleep(0.05)
+        reaper.cancel()
+        return await jobs.queue_ahead_of({"id": "new", "created_at": _ago(0)})
+
+    assert asyncio.run(scenario()) == 1
+    assert [doc["id"] for doc in fake.jobs.docs] == ["streaming"]
+    assert not (uploads / "stuck.wav").exists()
+
+
+def test_stale_heartbeats_are_ignored(monkeypatch):
+    fake = FakeDB(workers=[
+        {"id": "live", "concurrency": 2, "free_memory": 2048, "free_disk": 4096, "updated_at": _ago(1)},
+        {"id": "also-live", "concurrency": 1, "free_memory": 1024, "free_disk": 8192, "updated_at": _ago(2)},
+        {"id": "dead", "concurrency": 8, "free_memory": 9999, "free_disk": 9999, "updated_at": _ago(3600)},
+    ])
+    monkeypatch.setattr(jobs, 'db', fake)
+
+    # Slots add up across workers; headroom is the best single worker's
+    assert asyncio.run(jobs.worker_capacity()) == (3, 2048, 8192)
+
+    fake.workers.docs = fake.workers.docs[2:]
+    assert asyncio.run(jobs.worker_capacity()) == (None, None, None)
+
+
+def test_queue_eta_uses_slots_of_live_workers(api):
+    client, fake, uploads = api
+    fake.workers.docs = [{"id": f"w{n}", "concurrency": 1, "updated_at": _ago(1)} for n in range(2)]
+    fake.jobs.docs = [{"id": "running", "status": "processing", "created_at": _ago(60)},
+                      {"id": "queued", "status": "pending", "created_at": _ago(30)}]
+
+    response = _upload(client)
+
+    # Two workers: the queued job takes the free one, this upload waits one wave
+    assert response.status_code == 200
+    assert response.json()["queue_position"] == 2
+    assert response.json()["eta_seconds"] == 200
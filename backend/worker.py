@@ -0,0 +1,225 @@
+"""Processing worker: claims pending jobs from MongoDB and runs the pipeline.
+
+Run standalone with ``python worker.py`` next to API pods started with
+``EMBEDDED_WORKER=0``, or let ``server.py`` start it in-process (the default)
+for single-box deployments.
+"""
+import os
+import logging
+import asyncio
+import shutil
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from admission import free_disk_bytes, free_memory_bytes
+from conversion import warm_music21
+from jobs import (
+    PROCESSED_DIR, WORKER_HEARTBEAT_SECONDS, claim_next_job, db, expire_upload_reservations, publish_heartbeat,
+    reap_abandoned_jobs, release_job, storage, update_job
+)
+from pipeline import probe_duration, process_audio_to_stems_midi
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', '1'))
+WORKER_POLL_SECONDS = float(os.environ.get('WORKER_POLL_SECONDS', '1.0'))
+
+# How often a running job checks for a cancel request
+CANCEL_POLL_SECONDS = float(os.environ.get('CANCEL_POLL_SECONDS', '2.0'))
+
+# Per-job deadline: base + per_second * audio duration, capped at the maximum
+# (PROCESSING_TIMEOUT), which is also used when the duration is unknown
+JOB_DEADLINE_BASE_SECONDS = float(os.environ.get('JOB_DEADLINE_BASE_SECONDS', '300'))
+JOB_DEADLINE_PER_AUDIO_SECOND = float(os.environ.get('JOB_DEADLINE_PER_AUDIO_SECOND', '6'))
+JOB_DEADLINE_MAX_SECONDS = float(os.environ.get('PROCESSING_TIMEOUT', '3600'))
+
+# Jobs left processing by a dead worker are failed (or, with a cancel
+# request, cancelled) this long after their deadline / the request
+REAP_INTERVAL_SECONDS = float(os.environ.get('REAP_INTERVAL_SECONDS', '60'))
+REAP_GRACE_SECONDS = float(os.environ.get('REAP_GRACE_SECONDS', '120'))
+
+
+def job_deadline_seconds(duration: Optional[float]) -> float:
+    """Time a job may run for, scaled by the length of its audio"""
+    if duration is None:
+        return JOB_DEADLINE_MAX_SECONDS
+    return min(JOB_DEADLINE_BASE_SECONDS + JOB_DEADLINE_PER_AUDIO_SECOND * duration, JOB_DEADLINE_MAX_SECONDS)
+
+
+async def watch_job(job_id: str, deadline: float) -> str:
+    """Wait until the job is cancelled or runs past its deadline (loop time)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return "deadline"
+        await asyncio.sleep(min(CANCEL_POLL_SECONDS, remaining))
+        try:
+            job = await db.jobs.find_one({"id": job_id}, {"_id": 0, "cancel_requested": 1})
+        except Exception as e:
+            logger.warning(f"Cancel check failed for job {job_id}: {e}")
+            continue
+        if job is None or job.get("cancel_requested"):
+            return "cancelled"
+
+
+async def discard_job_files(job: dict):
+    """Free the upload and any partial outputs of a stopped job"""
+    shutil.rmtree(PROCESSED_DIR / job["id"], ignore_errors=True)
+    try:
+        await asyncio.to_thread(storage.delete_prefix, f"processed/{job['id']}/")
+        await asyncio.to_thread(storage.delete_prefix, f"uploads/{job['id']}")
+    except Exception as e:
+        logger.warning(f"Cleaning up files for job {job['id']} failed: {e}")
+
+
+async def abandon_job(job: dict):
+    """Hand a job back when this worker stops before finishing it"""
+    try:
+        released = await release_job(job["id"])
+    except Exception as e:
+        logger.warning(f"Handing back job {job['id']} failed: {e}")
+        return
+    if released and released["status"] == "cancelled":
+        await discard_job_files(job)
+
+
+async def run_job(job: dict):
+    """Run one claimed job through the pipeline"""
+    work_dir = PROCESSED_DIR / job["id"]
+    task = watcher = None
+    try:
+        # Remote backends download the upload into the job's scratch directory
+        scratch_path = work_dir / "input" / job["upload_file"]
+        try:
+            audio_path = await asyncio.to_thread(storage.fetch, f"uploads/{job['upload_file']}", scratch_path)
+        except Exception as e:
+            logger.error(f"Fetching upload failed for job {job['id']}: {e}")
+            await update_job(job["id"], status="failed", message=f"Processing failed: {e}")
+            return
+
+        duration = await probe_duration(audio_path)
+        timeout = job_deadline_seconds(duration)
+        deadline_at = datetime.now(timezone.utc) + timedelta(seconds=timeout)
+        await update_job(job["id"], deadline_at=deadline_at.isoformat())
+
+        # Run the pipeline alongside a watcher; whichever finishes first wins
+        task = asyncio.create_task(process_audio_to_stems_midi(job["id"], audio_path, job["filename"]))
+        watcher = asyncio.create_task(watch_job(job["id"], asyncio.get_running_loop().time() + timeout))
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            # The pipeline records its own success or failure
+            watcher.cancel()
+            return
+
+        # Cancelling the task kills any running Demucs/basic-pitch subprocess
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if not task.cancelled():
+            # Finished just before the cancel landed
+            return
+
+        reason = watcher.result()
+        await discard_job_files(job)
+        if reason == "cancelled":
+            logger.info(f"Job {job['id']} cancelled")
+            await update_job(job["id"], status="cancelled", message="Job cancelled.")
+        else:
+            logger.warning(f"Job {job['id']} exceeded its {timeout:.0f}s deadline")
+            await update_job(
+                job["id"],
+                status="failed",
+                message=f"Processing failed: exceeded the {timeout:.0f}s time limit for this file"
+            )
+    except asyncio.CancelledError:
+        # Worker shutting down mid-job: stop the pipeline, then hand the job
+        # back rather than leaving it processing with nobody running it
+        for pending in (task, watcher):
+            if pending:
+                pending.cancel()
+        if task:
+            await asyncio.gather(task, return_exceptions=True)
+        await abandon_job(job)
+        raise
+    finally:
+        # With remote storage the work directory is only scratch space
+        if storage.local_path(f"processed/{job['id']}") is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+async def heartbeat_loop(worker_id: str, concurrency: int, interval: float = WORKER_HEARTBEAT_SECONDS):
+    """Publish this worker's job slots, free memory and scratch disk for admission control"""
+    while True:
+        try:
+            await publish_heartbeat(worker_id, concurrency, free_memory_bytes(), free_disk_bytes(PROCESSED_DIR))
+        except Exception as e:
+            logger.warning(f"Heartbeat failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def reaper_loop(interval: float = REAP_INTERVAL_SECONDS, grace: float = REAP_GRACE_SECONDS):
+    """Finish off jobs whose worker died and uploads whose API process died"""
+    while True:
+        try:
+            for job in await reap_abandoned_jobs(grace):
+                logger.warning(f"Job {job['id']} lost its worker, marked {job['status']}")
+                await discard_job_files(job)
+            for job in await expire_upload_reservations():
+                logger.warning(f"Upload reservation {job['id']} expired")
+                await asyncio.to_thread(storage.delete_prefix, f"uploads/{job['id']}")
+        except Exception as e:
+            logger.warning(f"Reaping abandoned jobs failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def worker_loop(concurrency: int = WORKER_CONCURRENCY, poll_seconds: float = WORKER_POLL_SECONDS):
+    """Claim and run pending jobs forever, at most ``concurrency`` at a time"""
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    async def _run(job):
+        try:
+            await run_job(job)
+        except Exception as e:
+            logger.error(f"Worker failed on job {job['id']}: {e}")
+        finally:
+            slots.release()
+
+    heartbeat = asyncio.create_task(heartbeat_loop(f"{socket.gethostname()}-{os.getpid()}", concurrency))
+    reaper = asyncio.create_task(reaper_loop())
+
+    # Pay for music21's import and setup once, before the first job needs it
+    await asyncio.to_thread(warm_music21)
+    logger.info(f"Worker started (concurrency={concurrency})")
+
+    try:
+        while True:
+            await slots.acquire()
+            try:
+                job = await claim_next_job(JOB_DEADLINE_MAX_SECONDS)
+            except Exception as e:
+                logger.error(f"Failed to claim job: {e}")
+                job = None
+            if job is None:
+                slots.release()
+                await asyncio.sleep(poll_seconds)
+                continue
+            task = asyncio.create_task(_run(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        heartbeat.cancel()
+        reaper.cancel()
+        # Each job hands itself back (see run_job) before the loop exits
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(worker_loop())
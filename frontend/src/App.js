@@ -22,8 +22,8 @@ function App() {
         const response = await axios.get(`${API}/status/${jobId}`);
         setStatus(response.data);
 
-        // Stop polling if completed or failed
-        if (response.data.status === "completed" || response.data.status === "failed") {
+        // Stop polling once the job has finished
+        if (["completed", "failed", "cancelled"].includes(response.data.status)) {
           return;
         }
       } catch (err) {
@@ -109,14 +109,14 @@ function App() {
   };
 
   const getProgressColor = () => {
-    if (status?.status === "failed") return "bg-red-500";
+    if (status?.status === "failed" || status?.status === "cancelled") return "bg-red-500";
     if (status?.status === "completed") return "bg-green-500";
     return "bg-blue-500";
   };
 
   const getStatusIcon = () => {
     if (status?.status === "completed") return "✓";
-    if (status?.status === "failed") return "✗";
+    if (status?.status === "failed" || status?.status === "cancelled") return "✗";
     return "⟳";
   };
 
@@ -235,6 +235,7 @@ function App() {
                   <h2 className="text-2xl font-bold text-white mb-2">
                     {status?.status === "completed" ? "Processing Complete!" : 
                      status?.status === "failed" ? "Processing Failed" :
+                     status?.status === "cancelled" ? "Processing Cancelled" :
                      "Processing Your Audio..."}
                   </h2>
                   <p className="text-purple-200">{status?.filename}</p>